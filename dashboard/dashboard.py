@@ -1,6 +1,7 @@
 
 import io
 import os
+from functools import lru_cache
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -14,11 +15,15 @@ matplotlib.rcParams['figure.dpi'] = 100
 st.set_page_config(page_title="TrendTracker — Fashion Dashboard", page_icon="👕", layout="wide")
 sns.set_style("darkgrid")
 
+CACHE_TTL = 3600 # seconds; shared by the data cache and every aggregate/chart cache below
+KDE_MAX_POINTS = 50000 # delivery-time histogram only draws its KDE curve up to this many rows
+
 # ------------------------------
 # Utility helpers
 # ------------------------------
 
 # Formats numbers as AUD currency
+@lru_cache(maxsize=4096)
 def format_aud(value):
     try:
         return format_currency(value, 'AUD', locale='en_US')
@@ -27,22 +32,40 @@ def format_aud(value):
 
 # Computes Average Order Value (AOV)
 # General calc: Total Revenue/ No of Orders
-def compute_aov(df):
-    if df.empty:
+def compute_aov(orders_df):
+    if orders_df.empty:
         return 0.0
-    order_vals = df.groupby("order_id", as_index=False).agg({"total_price": "sum"})
-    return order_vals["total_price"].mean() if not order_vals.empty else 0.0
+    return orders_df["order_total"].mean()
 
 # Computes % of customers who made more than one purchase--> customers who made more than one unique order
 # general calc: (No of repeat customers / Total customers) * 100
 def compute_repeat_purchase_rate(df):
     if df.empty:
         return 0.0
-    purchases = df.groupby("customer_id").order_id.nunique()
+    # unique (customer, order) pairs first, then count rows per customer --> no of unique orders per customer
+    purchases = df[["customer_id", "order_id"]].drop_duplicates().groupby("customer_id", observed=True).size()
     repeat = (purchases > 1).sum()
     total_customers = purchases.shape[0]
     return (repeat / total_customers) if total_customers > 0 else 0.0
 
+# Quintile bin (0..4) of each value --> same bins as pd.qcut(values, 5, labels=False, duplicates='drop')
+def quintile_labels(values):
+    edges = pd.unique(pd.Series(values).dropna().quantile(np.linspace(0, 1, 6)).to_numpy())
+    if len(edges) < 2:
+        raise ValueError("Not enough distinct values for quintiles")
+    return np.searchsorted(edges[1:-1], values, side='left')
+
+# Rows of a categorical column whose value is in `selected`, as a NumPy bool array
+def category_mask(col, selected):
+    if not isinstance(col.dtype, pd.CategoricalDtype):
+        return col.isin(selected).to_numpy()
+    categories = col.cat.categories
+    # one extra False slot at the end: missing values have code -1, which indexes that slot
+    lookup = np.zeros(len(categories) + 1, dtype=bool)
+    idx = categories.get_indexer(selected)
+    lookup[idx[idx >= 0]] = True
+    return lookup[col.cat.codes.to_numpy()]
+
 # Convert matplotlib figure to a downloadable img (PNG)
 def fig_to_bytes(fig):
     buf = io.BytesIO()
@@ -50,83 +73,220 @@ def fig_to_bytes(fig):
     buf.seek(0)
     return buf
 
+# Charts are shown as PNG images: each figure is encoded once and closed right away,
+# so no live Figure stays in memory and Streamlit only ships the image bytes
+def fig_to_png(fig):
+    png = fig_to_bytes(fig).getvalue()
+    plt.close(fig)
+    return png
+
+# Every chart is displayed through here, as PNG bytes (from fig_to_png or cached_chart_png)
+def show_figure(png):
+    st.image(png, use_container_width=True)
+
 # ------------------------------
 # Helper functions (kept)
 # ------------------------------
-def create_daily_orders_df(df):
+# One row per order (line items summed), built once after filtering and reused by
+# the min-order filter, KPIs, daily orders, cohort and monthly AOV
+def create_orders_df(df):
     if df.empty:
+        return pd.DataFrame(columns=['order_id','order_total','order_date','customer_id','order_month'])
+    # narrow to the columns used below first, so the groupby doesn't carry every other column along
+    cols = df[['order_id', 'total_price', 'order_date', 'customer_id']]
+    orders_df = cols.groupby('order_id', as_index=False).agg(
+        order_total=('total_price', 'sum'),
+        order_date=('order_date', 'first'),
+        customer_id=('customer_id', 'first')
+    )
+    # converts the order_date to the first day of the month (eg. "2025-11-29" --> "2025-11-01")
+    # computed once here and shared by the cohort and monthly AOV analyses
+    # datetime64[M] is the month key used throughout (plain int64 months, no Period objects)
+    orders_df['order_month'] = orders_df['order_date'].values.astype('datetime64[M]')
+    return orders_df
+
+# Expects the order-level frame: each row is already one unique order
+def create_daily_orders_df(orders_df):
+    if orders_df.empty:
         return pd.DataFrame(columns=['order_date','order_count','revenue'])
-    daily_orders_df = df.resample(rule='D', on='order_date').agg({
-        'order_id': 'nunique',
-        'total_price': 'sum'
-    })
-    daily_orders_df = daily_orders_df.reset_index()
-    daily_orders_df.rename(columns={
-        'order_id': 'order_count',
-        'total_price': 'revenue'
-    }, inplace=True)
+    # Named aggregation: counts & revenue come out already labelled (no rename pass)
+    daily_orders_df = orders_df.resample(rule='D', on='order_date').agg(
+        order_count=('order_id', 'count'),
+        revenue=('order_total', 'sum')
+    ).reset_index()
     return daily_orders_df
 
 def create_sum_order_items_df(df):
     if 'quantity_x' not in df.columns:
-        df['quantity_x'] = 0
-    sum_order_items_df = df.groupby('product_name').quantity_x.sum().sort_values(ascending=False).reset_index()
+        df = df.assign(quantity_x=0)
+    sum_order_items_df = df[['product_name', 'quantity_x']].groupby('product_name', observed=True).quantity_x.sum().sort_values(ascending=False).reset_index()
     return sum_order_items_df
 
-def create_bygender_df(df):
-    if df.empty:
-        return pd.DataFrame(columns=['gender','customer_count'])
-    bygender_df = df.groupby(by='gender').customer_id.nunique().reset_index()
-    bygender_df.rename(columns={'customer_id': 'customer_count'}, inplace=True)
-    return bygender_df
-
-def create_byage_df(df):
-    if df.empty:
-        return pd.DataFrame(columns=['age_group','customer_count'])
-    byage_df = df.groupby(by='age_group').customer_id.nunique().reset_index()
-    byage_df.rename(columns={'customer_id': 'customer_count'}, inplace=True)
-    return byage_df
-
-def create_bystate_df(df):
-    if df.empty:
-        return pd.DataFrame(columns=['state','customer_count'])
-    bystate_df = df.groupby(by='state').customer_id.nunique().reset_index()
-    bystate_df.rename(columns={'customer_id': 'customer_count'}, inplace=True)
-    return bystate_df
-
-def create_rfm_df(df):
+# Unique customers per group: de-duplicate (customer_id, group) pairs, then count rows per group
+# (same result as groupby().customer_id.nunique(), without building a set per group)
+# The three demographic keys share one narrowed frame instead of each helper slicing main_df again;
+# sort=False skips ordering the groups (the charts sort by customer_count anyway)
+def create_demographics_dfs(df):
+    keys = {'gender': 'gender', 'age': 'age_group', 'state': 'state'}
     if df.empty:
+        return {name: pd.DataFrame(columns=[key, 'customer_count']) for name, key in keys.items()}
+    cols = df[['customer_id'] + list(keys.values())]
+    return {
+        name: cols[['customer_id', key]].drop_duplicates()
+                  .groupby(by=key, observed=True, sort=False).size().reset_index(name='customer_count')
+        for name, key in keys.items()
+    }
+
+# Expects the order-level frame (see create_orders_df): one row per order is enough for RFM,
+# so it groups far fewer rows than the line items and counts orders without a per-customer nunique
+def create_rfm_df(orders_df):
+    if orders_df.empty:
         return pd.DataFrame(columns=['customer_id','frequency','monetary','recency'])
-    rfm_df = df.groupby(by='customer_id', as_index=False).agg({
-        'order_date': 'max',
-        'order_id': 'nunique',
-        'total_price': 'sum'
-    })
-    rfm_df.columns = ['customer_id', 'max_order_timestamp', 'frequency', 'monetary']
-    rfm_df['max_order_timestamp'] = pd.to_datetime(rfm_df['max_order_timestamp'])
-    recent_date = df['order_date'].dt.date.max()
-    rfm_df['recency'] = rfm_df['max_order_timestamp'].dt.date.apply(lambda x: (recent_date - x).days)
+    # Single groupby pass per customer: last order, no of orders, total spend
+    rfm_df = orders_df.groupby(by='customer_id', as_index=False, observed=True).agg(
+        max_order_timestamp=('order_date', 'max'),
+        frequency=('order_id', 'size'),
+        monetary=('order_total', 'sum')
+    )
+    # One row per customer from here on: plain ids so charts/tables only see these customers,
+    # not every category of the full dataset
+    if isinstance(rfm_df['customer_id'].dtype, pd.CategoricalDtype):
+        rfm_df['customer_id'] = rfm_df['customer_id'].astype(rfm_df['customer_id'].cat.categories.dtype)
+        # pandas < 2 returns observed categorical groups in order of appearance: sort by id so the rank/top-N ties break the same on every version
+        rfm_df = rfm_df.sort_values('customer_id', ignore_index=True)
+    # recency (days since last order): whole-day subtraction on the datetime64 arrays,
+    # no per-customer Python date objects or lambda
+    # the latest order overall is the max of the per-customer last orders --> scan one value per customer, not every row
+    last_orders = rfm_df['max_order_timestamp'].values.astype('datetime64[D]')
+    recent_date = np.datetime64(rfm_df['max_order_timestamp'].max(), 'D')  # pandas max skips NaT
+    rfm_df['recency'] = (recent_date - last_orders).astype('int32')
     rfm_df.drop('max_order_timestamp', axis=1, inplace=True)
     return rfm_df
 
+# Cached aggregations, keyed on the sidebar filter values + loaded data fingerprint (filter_key) instead of hashing
+# the frames themselves: a leading underscore tells st.cache_data to skip hashing that arg.
+# Revisiting a filter combination returns the stored result without re-grouping.
+# max_entries caps how many filter combinations stay in memory (oldest are evicted first).
+@st.cache_data(ttl=CACHE_TTL, max_entries=32)
+def get_aggregates(_main_df, _orders_df, filter_key):
+    return dict(
+        daily=create_daily_orders_df(_orders_df),
+        items=create_sum_order_items_df(_main_df),
+        rfm=create_rfm_df(_orders_df),
+        **create_demographics_dfs(_main_df),
+    )
+
+# Cohort retention matrix: rows--> cohort month, columns--> months since first purchase
+@st.cache_data(ttl=CACHE_TTL, max_entries=32)
+def build_cohort(_orders_df, filter_key):
+    if _orders_df.empty:
+        return pd.DataFrame()
+    # one row per order is enough here: we only count unique customers per month
+    # order_month comes precomputed from create_orders_df
+    cohort_df = _orders_df[['customer_id','order_month']]
+
+    # "cohort month"--> the month of the customer's first order within the filtered orders
+    # (must come from the same filtered orders, not precomputed at load; transform --> no merge)
+    cohort_df = cohort_df.assign(
+        cohort_month=cohort_df.groupby('customer_id', observed=True)['order_month'].transform('min')
+    )
+
+    # period number: how many months? -->  since cohort month (customer's first purchase)
+    # That is, each order month - cohort month
+    # Example: If first purchase was in January and current order is in March, period_number = 2.
+    # datetime64[M] stores whole months since 1970, so this is one int64 subtraction on the raw arrays
+    # (no Period objects are created per row)
+    order_m = cohort_df['order_month'].values.astype('datetime64[M]')
+    cohort_m = cohort_df['cohort_month'].values.astype('datetime64[M]')
+    cohort_df = cohort_df.assign(period_number=(order_m - cohort_m).astype('int64'))
+
+    # cohort counts= per cohort , per period number--> how many unique customers
+    # shows customer retention over time for each cohort
+    # de-duplicate (cohort, period, customer) rows, then count rows per (cohort, period) pair
+    # (same as groupby().customer_id.nunique(), without building a set per group)
+    cohort_counts = (cohort_df[['cohort_month','period_number','customer_id']].drop_duplicates()
+                     .value_counts(['cohort_month','period_number'], sort=False)
+                     .reset_index(name='customer_id'))
+
+    # now pivot table, rows--> cohorts (by month), columns--> period number (no of months since first purchase)
+    # values--> customer_id (unique customers)
+    cohort_pivot = cohort_counts.pivot(index='cohort_month', columns='period_number', values='customer_id')
+    if cohort_pivot.empty:
+        return cohort_pivot
+
+    # cohort size--> Per cohort month --> no of customers in the first period number column. 
+    # This is the starting size of each cohort
+    cohort_sizes = cohort_pivot.iloc[:,0] # no of customers in each cohort (# Get first column (period 0))
+
+    # Dividing each number in the row by that cohort'starting size, replacing Nan with 0
+    # Example: (Before division)
+       # cohort_month	0 (month 0)	1 (month 1)	2 (month 2)
+       #  Jan-2025	       100	         80	       60
+       #  Feb-2025	       150	         90	       NaN
+    # After division: (example)
+      #  cohort_month	0	 1	    2
+      #  Jan-2025	  1.0	 0.8	0.6
+      #  Feb-2025     1.0	 0.6	NaN
+    # So, Jan-2025 cohort retained 80% of customers in the first month, 60% in the second month.
+    retention = cohort_pivot.divide(cohort_sizes, axis=0).fillna(0) # Convert to percentages
+    return retention
+
 # ------------------------------
 # Load data (remote source)
 # ------------------------------
 DATA_URL = 'https://raw.githubusercontent.com/shanusaras/TrendTracker-Fashion_Sales_and_Customers/main/dashboard/all_data.csv'
-
-@st.cache_data(ttl=3600) # Caches the data for 1 hour (3600 seconds) to improve performance.
-# Prevents re-fetching and reprocessing the data on every interaction.
-def load_data(url):
-    df = pd.read_csv(url)
+# Copy of the same CSV bundled next to this script, read only when DATA_URL can't be downloaded
+LOCAL_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'all_data.csv')
+CATEGORY_COLS = ['state', 'gender', 'age_group', 'product_name', 'customer_id']
+
+def read_source_csv(url):
+    # Low-cardinality grouping/filter keys --> category dtype, parsed straight into categories (no object intermediate)
+    # groupby/isin then work on small integer codes instead of hashing Python strings, and use far less memory
+    # (always group these with observed=True so only categories present in the filtered data show up)
+    category_dtypes = {col: 'category' for col in CATEGORY_COLS} # columns missing from the file are ignored
+    try:
+        # pyarrow's multi-threaded CSV parser (columns still land as regular NumPy-backed dtypes)
+        df = pd.read_csv(url, engine='pyarrow', dtype=category_dtypes)
+    except ImportError:
+        # the C parser would build categories from the raw text (customer ids as strings): convert after reading instead
+        df = pd.read_csv(url)
+        df = df.astype({col: 'category' for col in CATEGORY_COLS if col in df.columns})
     for col in ['order_date', 'delivery_date']:
         if col in df.columns:
+            # pyarrow already types ISO dates (as Python dates); this normalises both parsers to datetime64
             df[col] = pd.to_datetime(df[col], errors='coerce')
             # error= 'coerce' --> Coerce invalid parsing (dates) to NaT (Not a Time) instead of crashing
-    df.sort_values('order_date', inplace=True)
-    df.reset_index(drop=True, inplace=True)
+    # Whole-number measures --> smallest integer dtype that fits (int8/int16 instead of int64)
+    # Integer (not float32) so revenue sums stay exact; pandas sums small ints into int64, so no overflow either
+    for col in ['quantity_x', 'total_price']:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    # order ids are plain positive integers --> smallest unsigned dtype (cheaper to hash in the per-order groupby/isin)
+    if 'order_id' in df.columns and pd.api.types.is_integer_dtype(df['order_id']):
+        df['order_id'] = pd.to_numeric(df['order_id'], downcast='unsigned')
+    # ignore_index --> fresh 0..n-1 RangeIndex straight from the sort (no old index kept as an extra column,
+    # and no separate reset_index pass)
+    df.sort_values('order_date', inplace=True, ignore_index=True)
     return df
 
-all_df = load_data(DATA_URL)
+@st.cache_data(ttl=CACHE_TTL) # Caches the data for 1 hour (3600 seconds) to improve performance.
+# Prevents re-fetching and reprocessing the data on every interaction.
+def load_data(url, fallback_path=None):
+    try:
+        df = read_source_csv(url)
+    except OSError: # network errors (URLError/HTTPError) --> use the bundled copy if there is one
+        if not fallback_path or not os.path.exists(fallback_path):
+            raise
+        df = read_source_csv(fallback_path)
+    # Date range for the sidebar picker, computed once per load and cached with the data (not on every rerun)
+    min_date = df['order_date'].min().date()
+    max_date = df['order_date'].max().date()
+    # fingerprint of the loaded data (row count + latest order): part of the aggregation cache key, so
+    # aggregates/charts cached for the same filters are recomputed once newer data is loaded
+    data_token = (len(df), df['order_date'].max())
+    return df, min_date, max_date, data_token
+
+all_df, min_date, max_date, data_token = load_data(DATA_URL, LOCAL_DATA_PATH)
 # all_df is used throughout the dashboard
 
 # Ensure expected columns present
@@ -143,9 +303,6 @@ REMOTE_LOGO = "https://github.com/dicodingacademy/assets/raw/main/logo.png"
 st.sidebar.image(REMOTE_LOGO, use_container_width=True)
 st.sidebar.markdown("### Filters")
 
-min_date = all_df['order_date'].min().date()
-max_date = all_df['order_date'].max().date()
-
 start_date, end_date = st.sidebar.date_input(
     label='Select Date Range',
     min_value=min_date,
@@ -165,53 +322,69 @@ age_sel = st.sidebar.multiselect("Age group (multi-select)", options=age_groups,
 product_search = st.sidebar.text_input("Product name contains (case-insensitive)")
 min_order_value = st.sidebar.number_input("Min order total (AUD)", value=0, step=1)
 
-st.sidebar.markdown("---")
-st.sidebar.markdown("### Visualization Controls")
-top_n = st.sidebar.slider("Top N products to show", min_value=3, max_value=20, value=5)
-show_values_on_bars = st.sidebar.checkbox("Show values on bars", value=True)
-
 # ------------------------------
 # Apply filters
 # ------------------------------
-start_ts = pd.to_datetime(start_date)
-end_ts = pd.to_datetime(end_date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
-#  Ensures the end date includes the full day.
-
-mask = (all_df['order_date'] >= start_ts) & (all_df['order_date'] <= end_ts)
-# combines all the filters
-# mask is a boolean Series where True means the row matches all filters
-# Each condition (state_sel, gender_sel etc.) refines the mask
-if state_sel:
-    mask &= all_df['state'].isin(state_sel)
-if gender_sel:
-    mask &= all_df['gender'].isin(gender_sel)
-if age_sel:
-    mask &= all_df['age_group'].isin(age_sel)
-if product_search:
-    mask &= all_df['product_name'].str.contains(product_search, case=False, na=False)
+# date_input gives datetime.date objects: converted to Timestamps once here, then reused for the slice
+# bounds below and as part of the aggregation cache key (hashable, no string parsing per rerun)
+start_ts = pd.Timestamp(start_date)
+end_ts = pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(nanoseconds=1)
+#  Ensures the end date includes the full day (up to the last nanosecond, not just the last whole second).
+
+# Date range: all_df is sorted by order_date (see load_data), so the selected range is one
+# contiguous block of rows --> two binary searches find its bounds, no per-row comparison/mask needed
+# (same O(log n) lookup as a sorted DatetimeIndex + .loc[start:end], but order_date stays a plain column
+#  for the groupby/resample calls below)
+order_dates = all_df['order_date'].values
+lo = np.searchsorted(order_dates, start_ts.to_datetime64(), side='left')
+hi = np.searchsorted(order_dates, end_ts.to_datetime64(), side='right')
+date_df = all_df.iloc[lo:hi]
+
+# combines the multi-select filters
+# Each active filter (state_sel, gender_sel etc.) gives one bool array from its category codes,
+# then all of them are AND-ed together in a single NumPy reduction
+masks = [
+    category_mask(date_df[col], selected)
+    for col, selected in [('state', state_sel), ('gender', gender_sel), ('age_group', age_sel)]
+    if selected
+]
 
 # Apply filters to df
-main_df = all_df.loc[mask].copy()
+main_df = date_df.loc[np.logical_and.reduce(masks)] if masks else date_df
 
-# min order total: compute order totals then filter
+# Product search: plain substring match (no regex), run only on the already narrowed rows
+if product_search:
+    main_df = main_df.loc[main_df['product_name'].str.contains(product_search, case=False, na=False, regex=False)]
+# No .copy(): main_df is only read from here on (new columns are added with .assign on new frames),
+# so the filtered rows are not duplicated in memory on every rerun
+
+# Order-level frame: computed once here and reused by every order-based KPI/chart below
+orders_df = create_orders_df(main_df)
+
+# min order total: filter on the order totals, then keep only those orders' line items
 if min_order_value and min_order_value > 0 and not main_df.empty:
-    order_totals = main_df.groupby("order_id", as_index=False).total_price.sum().rename(columns={"total_price": "order_total"})
-    qualifying_orders = order_totals[order_totals["order_total"] >= float(min_order_value)]["order_id"]
-    main_df = main_df[main_df["order_id"].isin(qualifying_orders)].copy()
+    min_total = float(min_order_value)
+    orders_df = orders_df.query("order_total >= @min_total")
+    main_df = main_df[main_df["order_id"].isin(orders_df["order_id"])]
 
 # ------------------------------
 # Aggregations & KPIs
 # ------------------------------
-daily_orders_df = create_daily_orders_df(main_df)
-sum_order_items_df = create_sum_order_items_df(main_df)
-bygender_df = create_bygender_df(main_df)
-byage_df = create_byage_df(main_df)
-bystate_df = create_bystate_df(main_df)
-rfm_df = create_rfm_df(main_df)
+# Every sidebar filter that shapes main_df/orders_df, plus the loaded data's fingerprint;
+# used as the cache key for aggregations, the cohort matrix and the cached chart PNGs
+filter_key = (data_token, start_ts, end_ts, tuple(state_sel), tuple(gender_sel), tuple(age_sel), product_search, min_order_value)
+
+agg = get_aggregates(main_df, orders_df, filter_key)
+daily_orders_df = agg['daily']
+sum_order_items_df = agg['items']
+bygender_df = agg['gender']
+byage_df = agg['age']
+bystate_df = agg['state']
+rfm_df = agg['rfm']
 
 total_orders = int(daily_orders_df['order_count'].sum()) if not daily_orders_df.empty else 0
 total_revenue = float(daily_orders_df['revenue'].sum()) if not daily_orders_df.empty else 0.0
-avg_order_value = compute_aov(main_df)
+avg_order_value = compute_aov(orders_df)
 repeat_rate = compute_repeat_purchase_rate(main_df)
 
 # ------------------------------
@@ -227,13 +400,9 @@ k4.metric("Repeat Purchase Rate", f"{repeat_rate*100:.1f}%")
 st.markdown("---")
 
 # ------------------------------
-# Main layout: left charts & right actions
+# Chart builders: return the matplotlib figure, sections decide where it is shown/exported
 # ------------------------------
-left_col, right_col = st.columns([3, 1.15])
-
-with left_col:
-    # Orders over time
-    st.subheader("Orders Over Time")
+def build_orders_fig(daily_orders_df):
     fig, ax = plt.subplots(figsize=(12, 4))
     if not daily_orders_df.empty:
         ax.plot(daily_orders_df['order_date'], daily_orders_df['order_count'], marker='o', linewidth=2)
@@ -241,19 +410,158 @@ with left_col:
     ax.set_ylabel("Orders")
     ax.grid(alpha=0.25)
     fig.autofmt_xdate()
-    st.pyplot(fig)
+    return fig
+
+# Data is already aggregated, so bars are drawn with matplotlib directly (seaborn's barplot would
+# re-copy and re-aggregate the frame on every call)
+# One vertical bar per label, in the given order (NaN values leave an empty slot)
+def draw_bars(ax, labels, values, color, xlabel=None, ylabel=None):
+    x = np.arange(len(labels))
+    bars = ax.bar(x, values, color=color)
+    ax.set_xticks(x)
+    ax.set_xticklabels(labels)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    return bars
+
+def build_top_products_fig(top_products, show_values_on_bars):
+    fig, ax = plt.subplots(figsize=(10, 4))
+    # columns pulled out as NumPy arrays once; the bars and the value labels both read from these
+    qty = top_products["quantity_x"].to_numpy()
+    y = np.arange(len(qty))
+    bars = ax.barh(y, qty, color=sns.color_palette("Blues_d", len(qty)))
+    ax.set_yticks(y)
+    ax.set_yticklabels(top_products["product_name"].astype(str))
+    ax.invert_yaxis() # best seller on top
+    ax.set_xlabel("Units Sold")
+    ax.set_ylabel(None)
+    if show_values_on_bars:
+        # one bar_label call labels every bar at its end (instead of an ax.text per bar)
+        ax.bar_label(bars, labels=[f"{v:,}" for v in qty], padding=3, fontsize=10)
+    return fig
+
+def build_rfm_fig(rfm_df):
+    fig_rfm, ax_rfm = plt.subplots(nrows=1, ncols=3, figsize=(18, 4))
+    # The three top-5 slices are picked together up front from one narrowed frame,
+    # then each subplot just draws its slice
+    # nsmallest/nlargest pick the top 5 with a partial selection instead of sorting every customer
+    rfm_cols = rfm_df[['customer_id', 'recency', 'frequency', 'monetary']]
+    panels = [
+        ('recency', rfm_cols.nsmallest(5, 'recency'), 'By Recency (days)'),
+        ('frequency', rfm_cols.nlargest(5, 'frequency'), 'By Frequency'),
+        ('monetary', rfm_cols.nlargest(5, 'monetary'), 'By Monetary'),
+    ]
+    for ax, (col, top5, title) in zip(ax_rfm, panels):
+        draw_bars(ax, top5['customer_id'].astype(str), top5[col].to_numpy(), '#90CAF9', 'customer_id', col)
+        ax.set_title(title)
+    return fig_rfm
+
+# Rendered charts are cached as PNG bytes per chart + filter combination (filter_key, plus any chart options),
+# so a rerun that doesn't change the data reuses the image instead of calling plt.subplots and redrawing.
+# _build is a zero-arg function that builds the figure; it is only called on a cache miss.
+@st.cache_data(ttl=CACHE_TTL, max_entries=64)
+def cached_chart_png(chart, key, _build):
+    return fig_to_png(_build())
+
+# ------------------------------
+# Dashboard sections
+# ------------------------------
+# @st.fragment --> interacting with a widget inside a section reruns only that section,
+# not the whole script (filters, aggregations and every other chart are left as they are)
 
-    # Top Products
+@st.fragment
+def orders_over_time_section(daily_orders_df, filter_key):
+    st.subheader("Orders Over Time")
+    show_figure(cached_chart_png("orders", filter_key, lambda: build_orders_fig(daily_orders_df)))
+
+# The Top N / value-label controls live here (not in the sidebar) so changing them only redraws this chart
+@st.fragment
+def top_products_section(sum_order_items_df, filter_key):
     st.subheader("Top Product Performance")
-    top_products = sum_order_items_df.head(top_n)
-    fig2, ax2 = plt.subplots(figsize=(10, 4))
-    sns.barplot(data=top_products, x="quantity_x", y="product_name", palette="Blues_d", ax=ax2)
-    ax2.set_xlabel("Units Sold")
-    ax2.set_ylabel(None)
-    if show_values_on_bars:
-        for i, v in enumerate(top_products["quantity_x"]):
-            ax2.text(v, i, f" {v:,}", va="center", fontsize=10)
-    st.pyplot(fig2)
+    top_n = st.slider("Top N products to show", min_value=3, max_value=20, value=5, key="top_n")
+    show_values_on_bars = st.checkbox("Show values on bars", value=True, key="show_values_on_bars")
+    show_figure(cached_chart_png(
+        "top_products", (filter_key, top_n, show_values_on_bars),
+        lambda: build_top_products_fig(sum_order_items_df.head(top_n), show_values_on_bars)
+    ))
+
+@st.fragment
+def rfm_section(rfm_df, filter_key):
+    st.subheader("RFM — Top Customers (sample)")
+    show_figure(cached_chart_png("rfm", filter_key, lambda: build_rfm_fig(rfm_df)))
+
+@st.fragment
+def cohort_section(orders_df, filter_key):
+    st.subheader("Cohort Retention (Monthly)")
+    if not orders_df.empty:
+        retention = build_cohort(orders_df, filter_key)
+        if not retention.empty:
+            # visualizing as heatmap
+            fig_cohort, ax_cohort = plt.subplots(figsize=(12, max(4, 0.5*len(retention))))
+            sns.heatmap(retention, annot=True, fmt=".0%", cmap="YlGnBu", ax=ax_cohort)
+            ax_cohort.set_title("Cohort Retention (by months since first purchase)")
+            ax_cohort.set_ylabel("Cohort month")
+            ax_cohort.set_xlabel("Months since cohort")
+            show_figure(fig_to_png(fig_cohort))
+            st.markdown("**Interpretation idea:** look for steep drop-offs in the first 1–3 months — those are retention opportunities.")
+        else:
+            st.info("Not enough cohort data for a retention heatmap.")
+    else:
+        st.info("No data for cohort analysis with current filters.")
+
+# Download buttons rerun only this section when clicked
+@st.fragment
+def exports_section(main_df, daily_orders_df, sum_order_items_df, filter_key):
+    # CSV & Excel downloads
+    csv_bytes = main_df.to_csv(index=False).encode('utf-8')
+    excel_buffer = io.BytesIO()
+    try:
+        # xlsxwriter only writes (no in-memory workbook model like openpyxl) --> faster, lighter export
+        # (its constant_memory mode is not used: pandas writes cells column by column and that mode would drop them)
+        try:
+            writer = pd.ExcelWriter(excel_buffer, engine='xlsxwriter')
+        except ImportError:
+            writer = pd.ExcelWriter(excel_buffer, engine='openpyxl')
+        with writer:
+            main_df.to_excel(writer, index=False, sheet_name='filtered')
+        excel_buffer.seek(0)
+        st.download_button("Download filtered CSV", data=csv_bytes, file_name="trendtracker_filtered.csv", mime="text/csv")
+        st.download_button("Download filtered Excel", data=excel_buffer, file_name="trendtracker_filtered.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    except Exception as e:
+        # fallback: provide CSV only if neither xlsxwriter nor openpyxl is available
+        st.download_button("Download filtered CSV", data=csv_bytes, file_name="trendtracker_filtered.csv", mime="text/csv")
+        st.warning("Excel export requires xlsxwriter or openpyxl. Install one (pip install xlsxwriter) to enable Excel downloads.")
+
+    st.markdown("---")
+    st.subheader("Download Charts")
+    # Chart PNGs are built only on request; the bytes are kept in session_state so the download buttons
+    # stay up on later reruns (until the filters or Top N settings change)
+    # (Top N settings are read from the Top products section's widgets)
+    top_n = st.session_state.get("top_n", 5)
+    show_values_on_bars = st.session_state.get("show_values_on_bars", True)
+    png_key = (filter_key, top_n, show_values_on_bars)
+    if st.button("Prepare chart PNGs"):
+        # Same cached PNGs as the on-screen charts
+        st.session_state["chart_pngs"] = (png_key, {
+            "orders": cached_chart_png("orders", filter_key, lambda: build_orders_fig(daily_orders_df)),
+            "top_products": cached_chart_png(
+                "top_products", png_key,
+                lambda: build_top_products_fig(sum_order_items_df.head(top_n), show_values_on_bars)
+            ),
+        })
+    stored_key, chart_pngs = st.session_state.get("chart_pngs", (None, None))
+    if stored_key == png_key:
+        st.download_button("Download Orders chart (PNG)", data=chart_pngs["orders"], file_name="orders_over_time.png", mime="image/png")
+        st.download_button("Download Top products (PNG)", data=chart_pngs["top_products"], file_name="top_products.png", mime="image/png")
+
+# ------------------------------
+# Main layout: left charts & right actions
+# ------------------------------
+left_col, right_col = st.columns([3, 1.15])
+
+with left_col:
+    orders_over_time_section(daily_orders_df, filter_key)
+    top_products_section(sum_order_items_df, filter_key)
 
     # Customer Demographics Snapshot
     st.subheader("Customer Demographics Snapshot")
@@ -261,33 +569,18 @@ with left_col:
     with d1:
         gender_counts = bygender_df.sort_values(by='customer_count', ascending=False)
         fig3, ax3 = plt.subplots(figsize=(6, 4))
-        sns.barplot(data=gender_counts, x="gender", y="customer_count", ax=ax3)
-        ax3.set_ylabel("Unique Customers")
-        st.pyplot(fig3)
+        draw_bars(ax3, gender_counts["gender"].astype(str), gender_counts["customer_count"].to_numpy(), "C0", "gender", "Unique Customers")
+        show_figure(fig_to_png(fig3))
     with d2:
-        age_counts = byage_df.sort_values(by='customer_count', ascending=False)
+        # fixed youngest-to-oldest order; a group missing from the filtered data leaves an empty slot
+        age_order = ['Youth', 'Adults', 'Seniors']
+        age_counts = byage_df.set_index('age_group')['customer_count'].reindex(age_order)
         fig4, ax4 = plt.subplots(figsize=(6, 4))
-        sns.barplot(data=age_counts, x="age_group", y="customer_count", order=['Youth','Adults','Seniors'], ax=ax4)
-        st.pyplot(fig4)
+        draw_bars(ax4, age_order, age_counts.to_numpy(dtype=float), "C0", "age_group", "customer_count")
+        show_figure(fig_to_png(fig4))
 
     # RFM plots (kept original charts)
-    st.subheader("RFM — Top Customers (sample)")
-    fig_rfm, ax_rfm = plt.subplots(nrows=1, ncols=3, figsize=(18, 4))
-    try:
-        asc_recency = rfm_df.sort_values(by='recency', ascending=True).head(5)
-        sns.barplot(y='recency', x='customer_id', data=asc_recency, palette=['#90CAF9'], ax=ax_rfm[0])
-        ax_rfm[0].set_title('By Recency (days)')
-
-        desc_freq = rfm_df.sort_values(by='frequency', ascending=False).head(5)
-        sns.barplot(y='frequency', x='customer_id', data=desc_freq, palette=['#90CAF9'], ax=ax_rfm[1])
-        ax_rfm[1].set_title('By Frequency')
-
-        desc_monetary = rfm_df.sort_values(by='monetary', ascending=False).head(5)
-        sns.barplot(y='monetary', x='customer_id', data=desc_monetary, palette=['#90CAF9'], ax=ax_rfm[2])
-        ax_rfm[2].set_title('By Monetary')
-    except Exception:
-        pass
-    st.pyplot(fig_rfm)
+    rfm_section(rfm_df, filter_key)
 
     # ------------------------------
     # Advanced analyses: Cohort, AOV, CLTV, Delivery time, RFM segments
@@ -296,75 +589,14 @@ with left_col:
     st.header("Advanced Analyses")
 
     # 1) Cohort retention heatmap
-    st.subheader("Cohort Retention (Monthly)")
-    if not main_df.empty:
-        cohort_df = main_df[['customer_id','order_date']].copy()
-
-        # converts the order_date to the first day of the month (eg. "2025-11-29" --> "2025-11-01")
-        cohort_df['order_month'] = cohort_df['order_date'].dt.to_period('M').dt.to_timestamp()
-
-        # Finding , per customer_id--> first purchase date and extract the month--> cohort month
-        # "cohort month"--> the month they first became a customer
-        first_order = cohort_df.groupby('customer_id')['order_date'].min().reset_index()
-        first_order['cohort_month'] = first_order['order_date'].dt.to_period('M').dt.to_timestamp()
-
-        # left Joining cohort_df + first_order on--> customer_id
-        # so for each customer, we have cohort month, every order month
-        cohort_df = cohort_df.merge(first_order[['customer_id','cohort_month']], on='customer_id', how='left')
-
-        # period number: how many months? -->  since cohort month (customer's first purchase)
-        # That is, each order month - cohort month
-        # Example: If first purchase was in January and current order is in March, period_number = 2.
-        cohort_df['period_number'] = (
-            cohort_df['order_month'].dt.to_period('M').astype(int) - cohort_df['cohort_month'].dt.to_period('M').astype(int)
-        )
-
-        # cohort counts= per cohort , per period number--> how many unique customers
-        # shows customer retention over time for each cohort
-        cohort_counts = cohort_df.groupby(['cohort_month','period_number'])['customer_id'].nunique().reset_index()
-        
-        # now pivot table, rows--> cohorts (by month), columns--> period number (no of months since first purchase)
-        # values--> customer_id (unique customers)
-        cohort_pivot = cohort_counts.pivot(index='cohort_month', columns='period_number', values='customer_id')
-        
-        # 
-        if cohort_pivot is not None and not cohort_pivot.empty:
-            # cohort size--> Per cohort month --> no of customers in the first period number column. 
-            # This is the starting size of each cohort
-            cohort_sizes = cohort_pivot.iloc[:,0] # no of customers in each cohort (# Get first column (period 0))
-
-            
-            # Dividing each number in the row by that cohort'starting size, replacing Nan with 0
-            # Example: (Before division)
-               # cohort_month	0 (month 0)	1 (month 1)	2 (month 2)
-               #  Jan-2025	       100	         80	       60
-               #  Feb-2025	       150	         90	       NaN
-            # After division: (example)
-              #  cohort_month	0	 1	    2
-              #  Jan-2025	  1.0	 0.8	0.6
-              #  Feb-2025     1.0	 0.6	NaN
-            # So, Jan-2025 cohort retained 80% of customers in the first month, 60% in the second month.
-            retention = cohort_pivot.divide(cohort_sizes, axis=0).fillna(0) # Convert to percentages
-            
-            # visualizing as heatmap
-            fig_cohort, ax_cohort = plt.subplots(figsize=(12, max(4, 0.5*len(retention))))
-            sns.heatmap(retention, annot=True, fmt=".0%", cmap="YlGnBu", ax=ax_cohort)
-            ax_cohort.set_title("Cohort Retention (by months since first purchase)")
-            ax_cohort.set_ylabel("Cohort month")
-            ax_cohort.set_xlabel("Months since cohort")
-            st.pyplot(fig_cohort)
-            st.markdown("**Interpretation idea:** look for steep drop-offs in the first 1–3 months — those are retention opportunities.")
-        else:
-            st.info("Not enough cohort data for a retention heatmap.")
-    else:
-        st.info("No data for cohort analysis with current filters.")
+    cohort_section(orders_df, filter_key)
 
     # 2) Monthly AOV trend
     st.subheader("AOV Trend (Monthly)")
     
-    # 1. Per order_id, per order_month--> find total price (since per order_id may contain many order items)
-    # 2. Extract month --> from order_date
-    # 3. now, per month--> find mean of total price
+    # 1. Per order_id--> total price is already summed in orders_df (order_total)
+    # 2. Extract month --> from order_date (order_month, already in orders_df)
+    # 3. now, per month--> find mean of order total
     # Example:- If, 
     #    order_id    order_date       total_price      month
     #        101    2025-01-01          150        2025-01-01
@@ -375,17 +607,15 @@ with left_col:
     #     2025-01-01        175.0       # (150 + 200) / 2 = 175
     #     2025-02-01        150.0       # Only one order in February
     if not main_df.empty:
-        orders_tot = main_df.groupby(['order_id', pd.Grouper(key='order_date', freq='M')])['total_price'].sum().reset_index()
-        orders_tot['month'] = orders_tot['order_date'].dt.to_period('M').dt.to_timestamp()
-        aov_monthly = orders_tot.groupby('month')['total_price'].mean().reset_index()
+        aov_monthly = orders_df.groupby('order_month')['order_total'].mean().reset_index()
         fig_aov, ax_aov = plt.subplots(figsize=(10,3))
-        ax_aov.plot(aov_monthly['month'], aov_monthly['total_price'], marker='o', linewidth=2)
+        ax_aov.plot(aov_monthly['order_month'], aov_monthly['order_total'], marker='o', linewidth=2)
         ax_aov.set_title("Monthly AOV")
         ax_aov.set_ylabel("AUD (avg order)")
         fig_aov.autofmt_xdate()
-        st.pyplot(fig_aov)
+        show_figure(fig_to_png(fig_aov))
         if not aov_monthly.empty:
-            latest_aov = aov_monthly['total_price'].iloc[-1]
+            latest_aov = aov_monthly['order_total'].iloc[-1]
             st.metric("Latest AOV", format_aud(latest_aov))
     else:
         st.info("No data to compute AOV.")
@@ -399,9 +629,9 @@ with left_col:
         sns.histplot(cltv_df['cltv'].dropna(), bins=50, log_scale=(True, False), ax=ax_cltv)
         ax_cltv.set_xlabel("CLTV (AUD)")
         ax_cltv.set_title("Distribution of Customer Value (monetary)")
-        st.pyplot(fig_cltv)
-        top_customers = cltv_df.sort_values(by='cltv', ascending=False).head(10)
-        st.table(top_customers[['customer_id','cltv','frequency']].assign(cltv=lambda df: df['cltv'].map(lambda x: format_aud(x))))
+        show_figure(fig_to_png(fig_cltv))
+        top_customers = cltv_df.nlargest(10, 'cltv')
+        st.table(top_customers[['customer_id','cltv','frequency']].assign(cltv=lambda df: df['cltv'].map(format_aud)))
     else:
         st.info("RFM data not available for CLTV.")
 
@@ -411,10 +641,14 @@ with left_col:
         dt = (main_df['delivery_date'] - main_df['order_date']).dt.days.dropna()
         if not dt.empty:
             fig_dt, ax_dt = plt.subplots(figsize=(8,3))
-            sns.histplot(dt, bins=30, kde=True, ax=ax_dt)
+            if len(dt) <= KDE_MAX_POINTS:
+                sns.histplot(dt, bins=30, kde=True, ax=ax_dt)
+            else:
+                # too many rows for the KDE pass (its cost grows with the filtered rows), so a plain histogram
+                ax_dt.hist(dt.to_numpy(), bins=30, edgecolor='white')
             ax_dt.set_xlabel("Delivery time (days)")
             ax_dt.set_title("Distribution of Delivery Time")
-            st.pyplot(fig_dt)
+            show_figure(fig_to_png(fig_dt))
             st.metric("Median delivery (days)", f"{int(dt.median())}")
         else:
             st.info("No delivery_date values in filtered data.")
@@ -430,7 +664,7 @@ with left_col:
         # For recency: lower recency is better so invert scores: smallest recency -> highest rank
         # # We subtract from 5 to make higher scores better
         try:
-            rfm_score['r_quintile'] = pd.qcut(rfm_score['recency'], 5, labels=False, duplicates='drop')  # 0..4
+            rfm_score['r_quintile'] = quintile_labels(rfm_score['recency'].to_numpy())  # 0..4
             rfm_score['r_quintile'] = 5 - rfm_score['r_quintile']  # invert so 5 is best
         except Exception:
             rfm_score['r_quintile'] = 3
@@ -438,8 +672,8 @@ with left_col:
         # For frequency: Higher is better
         # # Using .rank(method='first') to handle ties
         try:
-            rfm_score['f_quintile'] = pd.qcut(rfm_score['frequency'].rank(method='first'), 5, labels=False, duplicates='drop') + 1
-            rfm_score['m_quintile'] = pd.qcut(rfm_score['monetary'], 5, labels=False, duplicates='drop') + 1
+            rfm_score['f_quintile'] = quintile_labels(rfm_score['frequency'].rank(method='first').to_numpy()) + 1
+            rfm_score['m_quintile'] = quintile_labels(rfm_score['monetary'].to_numpy()) + 1
         except Exception:
             rfm_score['f_quintile'] = 3
             rfm_score['m_quintile'] = 3
@@ -457,14 +691,15 @@ with left_col:
         if not seg_counts.empty:
             # barplot of top 10 most common RFM segments
             fig_seg, ax_seg = plt.subplots(figsize=(8,3))
-            sns.barplot(data=seg_counts.head(10), x='rfm_score', y='count', ax=ax_seg)
+            top_segs = seg_counts.head(10)
+            draw_bars(ax_seg, top_segs['rfm_score'], top_segs['count'].to_numpy(), "C0", 'rfm_score', 'count')
             ax_seg.set_title("Top RFM score counts")
-            st.pyplot(fig_seg)
+            show_figure(fig_to_png(fig_seg))
 
             # revenue share by segment
 
             # Calculate total revenue per customer
-            cust_rev = main_df.groupby('customer_id', as_index=False).total_price.sum().rename(columns={'total_price':'customer_revenue'})
+            cust_rev = main_df[['customer_id', 'total_price']].groupby('customer_id', as_index=False, observed=True).total_price.sum().rename(columns={'total_price':'customer_revenue'})
             # Merge wtih RFM scores
             merged = rfm_score.merge(cust_rev, on='customer_id', how='left')
             # Group by RFM score and calculate total revenue
@@ -473,7 +708,7 @@ with left_col:
             # Display the top revenue-generating segments
             st.write("Top segments by revenue (sample):")
             if not seg_rev.empty:
-                st.dataframe(seg_rev.assign(customer_revenue=lambda df: df['customer_revenue'].map(lambda x: format_aud(x))))
+                st.dataframe(seg_rev.assign(customer_revenue=lambda df: df['customer_revenue'].map(format_aud)))
         else:
             st.info("Not enough RFM variation to segment.")
     else:
@@ -488,35 +723,19 @@ with right_col:
     st.write(f"Unique products: **{main_df['product_name'].nunique():,}**")
     st.markdown("---")
 
-    # CSV & Excel downloads
-    csv_bytes = main_df.to_csv(index=False).encode('utf-8')
-    excel_buffer = io.BytesIO()
-    try:
-        with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-            main_df.to_excel(writer, index=False, sheet_name='filtered')
-        excel_buffer.seek(0)
-        st.download_button("Download filtered CSV", data=csv_bytes, file_name="trendtracker_filtered.csv", mime="text/csv")
-        st.download_button("Download filtered Excel", data=excel_buffer, file_name="trendtracker_filtered.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-    except Exception as e:
-        # fallback: provide CSV only if openpyxl missing
-        st.download_button("Download filtered CSV", data=csv_bytes, file_name="trendtracker_filtered.csv", mime="text/csv")
-        st.warning("Excel export requires openpyxl. Install it (pip install openpyxl) to enable Excel downloads.")
-
-    st.markdown("---")
-    st.subheader("Download Charts")
-    # `fig_to_bytes()` : Function to convert matplotlib figures to downloadable PNGs.
-    st.download_button("Download Orders chart (PNG)", data=fig_to_bytes(fig), file_name="orders_over_time.png", mime="image/png")
-    st.download_button("Download Top products (PNG)", data=fig_to_bytes(fig2), file_name="top_products.png", mime="image/png")
+    # CSV & Excel downloads + chart PNGs
+    exports_section(main_df, daily_orders_df, sum_order_items_df, filter_key)
 
     st.markdown("---")
     st.subheader("Auto insights (sample)")
-    # Calculate top 3 states by total revenue
-    top_states = main_df.groupby("state").total_price.sum().reset_index().sort_values(by="total_price", ascending=False).head(3)
+    # Calculate top 3 states by total revenue (nlargest --> no full sort of the state totals)
+    top_states = main_df[["state", "total_price"]].groupby("state", observed=True).total_price.sum().nlargest(3).reset_index()
     if not top_states.empty:
-        for i, row in top_states.iterrows():
-            st.write(f"- {row['state']}: {format_aud(row['total_price'])}")
+        # zip over the raw column arrays instead of iterrows (which builds a Series per row)
+        for state, revenue in zip(top_states['state'].to_numpy(), top_states['total_price'].to_numpy()):
+            st.write(f"- {state}: {format_aud(revenue)}")
     else:
         st.write("No state revenue for current filters")
 
 st.markdown("---")
-st.caption("Notes: Currency uses en_US formatting (AUD). Replace DATA_URL with a local file path if you want offline use.")
+st.caption("Notes: Currency uses en_US formatting (AUD). Data is downloaded from DATA_URL; the bundled dashboard/all_data.csv is used only if the download fails.")